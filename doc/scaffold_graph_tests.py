@@ -2,8 +2,8 @@
 This library generates the graph diagrams in doc/scaffold.ipynb,
 as well as corresponding test cases in src/test-swap-scaffold.rs
 """
-from collections import Counter
-from itertools import tee
+import io
+from itertools import pairwise
 from typing import Union as U
 import graphviz
 
@@ -16,16 +16,9 @@ setattr(graphviz.Digraph, '__repr__', lambda self:'[Digraph]')
 # we're going to batch the tests up up and write them at the end
 RUST_TESTS = []  # [{setup:str, check:str, label:str}]
 
-def write_tests():
-    with open('../src/test-swap-scaffold.rs','w',newline='\n') as o:
-        o.write('///! test suite generated from doc/scaffold.ipynb\n\n')
-        o.write('#[cfg(test)] use std::iter::FromIterator;\n\n')
-        for i, item in enumerate(RUST_TESTS):
-            o.write('\n'.join([
-                f'/// test for diagram #{i}: {item["label"]}',
-                f'#[allow(unused_variables)]',
-                f'#[test] fn test_scaffold_diagram{i}() {{',
-"""
+# constant chunks of the test template, hoisted out of the write_tests loop
+# (the trailing blank lines account for the newlines between the chunks)
+_SETUP_PRE = """
     let mut xs = XVHLScaffold::new();
     // arbitrary fake vars for the fake nodes to reference. (these go at the bottom)
     let vn0 = VID::var(0); xs.push(vn0); let vx0 = VID::var(20); xs.push(vx0);
@@ -66,9 +59,11 @@ def write_tests():
     let (a0,a1,a2,a3) = (node(va,!x0,x0), node(va,!x1,x1), node(va,!x2,x2), node(va,!x3,x3));
 
     // setup code generated from the diagram:
-""",
-                item["setup"],
+
 """
+
+_CHECK_PRE = """
+
     // go back and clear out the fake nodes we created earlier:
     let mut i = 1;
     while i <= SLOTS && xs.vhls[i].v.is_vir() { i+=1 }
@@ -81,20 +76,47 @@ def write_tests():
     xs.swap(vu);
 
     // checks generated from the diagram:
-""",
-                item["check"],
+
 """
+
+_CHECK_POST = """
+
 }
-""",
-                f'\n\n']))
+
+
+
+"""
+
+def render_tests():
+    """render the whole test suite to a single string"""
+    buf = io.StringIO()
+    buf.write('///! test suite generated from doc/scaffold.ipynb\n\n'
+              '#[cfg(test)] use std::iter::FromIterator;\n\n')
+    for i, item in enumerate(RUST_TESTS):
+        buf.write(f'/// test for diagram #{i}: {item["label"]}\n')
+        buf.write('#[allow(unused_variables)]\n')
+        buf.write(f'#[test] fn test_scaffold_diagram{i}() {{\n')
+        buf.write(_SETUP_PRE); buf.write(item["setup"])
+        buf.write(_CHECK_PRE); buf.write(item["check"])
+        buf.write(_CHECK_POST)
+    return buf.getvalue()
+
+def write_tests():
+    # everything is already in memory, so the file write is a single call:
+    with open('../src/test-swap-scaffold.rs','w',newline='\n') as o:
+        o.write(render_tests())
 
 def xid(x:U[int,str])->str:
     """convert the graph label to a XID var used in the test suite (defined in src/test-swap.rs)"""
     return f"n{abs(x)}" if type(x) == int else "un" if x=="*" else x
 
+# rows a and z are fixed, so these parts of every diagram never change:
+_FIXED_VMAP = {x:'v'+x[0] for x in "z0 z1 z2 z3 a0 a1 a2 a3".split()}
+_SEEN_SEED = frozenset({'a0','a1','a2','a3','un'})
+
 def make_vmap(ru,rd):
     """return a dict mapping ids in the notation to their rust variable names"""
-    r = {x:'v'+x[0] for x in "z0 z1 z2 z3 a0 a1 a2 a3".split()}
+    r = dict(_FIXED_VMAP)
     r.update({x:'vu' for x in ru})
     r.update({x:'vd' for x in rd})
     return r
@@ -108,7 +130,7 @@ def make_xvhls(ru,rd,ites):
     #    so that we don't delete a node after pointing an edge to it.
     # !! I think it reads better from top to bottom though (that's how I wrote them)
     #    so for now, you have to just manually write the ite triples from top to bottom in the spec.
-    seen = {'a0','a1','a2','a3','un'}    # this is so we can at least warn if you use the wrong order.
+    seen = set(_SEEN_SEED)    # this is so we can at least warn if you use the wrong order.
     for i, t, e in reversed(ites):
         v, x, hi, lo = vmap[i], xid(i), xid(t), xid(e)
         if hi in seen and lo in seen:
@@ -116,27 +138,35 @@ def make_xvhls(ru,rd,ites):
             yield x,v,hi,lo
         else: raise ValueError(f'ites must be specified from top to bottom for now! (bad: {repr((i,t,e))})')
 
-def rust_scaffold_setup(ru,rd,ites):
+def _make_setup_template(un_hi, un_lo):
+    """specialize the setup emitter for one ('un' in hi, 'un' in lo) shape"""
+    hi = 'old_vhl.hi' if un_hi else '{hi}'
+    lo = 'old_vhl.lo' if un_lo else '{lo}'
+    return ('  let (old_xid, old_vhl) = ({x}, xs.get({x}).unwrap()); xs.del_node({x});\n'
+            '  let {x} = xs.add_ref(XVHL{{ v:{v}, hi:' + hi + ', lo:' + lo + ' }}, 0, 0);\n'
+            '  assert_eq!({x}.raw(), old_xid.raw(), "scaffold failed to reuse empty slot for {x}.");')
+
+# one precompiled template per shape, selected by a tuple key:
+_SETUP_TEMPLATES = {(h, l): _make_setup_template(h, l)
+                    for h in (False, True) for l in (False, True)}
+
+def rust_scaffold_setup(xvhls):
     """used to translate the "before" diagram into code to set up the scaffold"""
-    for x, v, hi, lo in make_xvhls(ru,rd,ites):
-        yield f'  let (old_xid, old_vhl) = ({x}, xs.get({x}).unwrap()); xs.del_node({x});'
-        if hi == 'un': hi = 'old_vhl.hi'
-        if lo == 'un': lo = 'old_vhl.lo'
-        yield f'  let {x} = xs.add_ref(XVHL{{ v:{v}, hi:{hi}, lo:{lo} }}, 0, 0);'
-        yield f'  assert_eq!({x}.raw(), old_xid.raw(), "scaffold failed to reuse empty slot for {x}.");'
-
-def rust_scaffold_check(ru,rd,ites):
+    for x, v, hi, lo in xvhls:
+        yield _SETUP_TEMPLATES[hi == 'un', lo == 'un'].format(x=x, v=v, hi=hi, lo=lo)
+
+def rust_scaffold_check(ru,rd,xvhls):
     """used to translate the "after" diagram into a set of rust assertions to make after calling swap()"""
-    refs = Counter()
+    refs = {}
     # check that the nodes on rows u and d match the diagram exactly:
     for v, row in [('u',ru), ('d',rd)]:
         actual = f"xs.xids_on_row(v{v})"
         expect = f"HashSet::from_iter(vec![{', '.join(xid(x) for x in row)}])"
         yield f'  assert_eq!({actual}, {expect}, "row {v} didn\'t match expected values!");'
     # do our own refcount based on the diagram, and check that the vhl entry matches:
-    for x, v, hi, lo in make_xvhls(ru,rd,ites):
-        refs[hi]+=1
-        refs[lo]+=1
+    for x, v, hi, lo in xvhls:
+        refs[hi] = refs.get(hi, 0) + 1
+        refs[lo] = refs.get(lo, 0) + 1
         yield f' {{ let x=xs.get({x}).unwrap();'
         if hi != 'un': yield f'    assert_eq!( x.hi, {hi}, "wrong .hi for node {x}");'
         if lo != 'un': yield f'    assert_eq!( x.lo, {lo}, "wrong .hi for node {x}");'
@@ -147,10 +177,12 @@ def rust_scaffold_check(ru,rd,ites):
         yield f'  assert_eq!(xs.get_refcount({x}).unwrap(), {rc}, "bad refcount for node {x} ({{:?}})!", {x});'
 
 def test_ite_scaffold(label, before, after):
+    # materialize the xvhl tuples once per diagram, rather than once per consumer
     RUST_TESTS.append({
         'label': label,
-        'setup': '\n'.join(rust_scaffold_setup(**before)),
-        'check': '\n'.join(rust_scaffold_check(**after)) })
+        'setup': '\n'.join(rust_scaffold_setup(list(make_xvhls(**before)))),
+        'check': '\n'.join(rust_scaffold_check(after['ru'], after['rd'],
+                                               list(make_xvhls(**after)))) })
 
 def ite_scaffold(label, before, after):
     test_ite_scaffold(label, before, after)
@@ -163,12 +195,6 @@ FADE = "#cccccc"
 TEXT = "black"
 INVIS = "white"
 
-def pairs(xs):
-    xs, ys = tee(xs)
-    next(ys, None)
-    return zip(xs, ys)
-
-
 def add_row(g, n, row, active, nodes, **kw):
     with g.subgraph(name=n+row) as c:
         c.attr(rank='same', pencolor=FADE)
@@ -179,15 +205,18 @@ def add_row(g, n, row, active, nodes, **kw):
             c.attr(style='filled', color=bcolor, fontcolor='black', pencolor=pcolor)
         c.attr('node', **kw)
         nodes = [(x,x) if isinstance(x,str) else x for x in nodes]
-        for i,(x,lbl) in enumerate(nodes):
-            fcolor = 'orange' if row =='u' else 'dodgerblue' if row=='d' else 'white'
-            ncolor = 'black' if row in 'ud' else FADE if x in active else INVIS
-            tcolor = ncolor if row in 'az' else TEXT
+        # these only depend on the row, so compute them once, not per node:
+        is_ud = row in 'ud'
+        is_az = row in 'az'
+        fcolor = 'orange' if row =='u' else 'dodgerblue' if row=='d' else 'white'
+        for x,lbl in nodes:
+            ncolor = 'black' if is_ud else FADE if x in active else INVIS
+            tcolor = ncolor if is_az else TEXT
             c.node(n+x, label=lbl, group=row, style='filled',
                    color=ncolor, fillcolor=fcolor, fontcolor=tcolor)
         # force them to flow left-to right
         if row in 'az' or (row=='u' and n=='a') or (row=='d' and n=='b'):
-            for x,y in pairs([n+row]+[n+x[0] for x in nodes]):
+            for x,y in pairwise([n+row]+[n+x[0] for x in nodes]):
                 c.edge(x,y,style='invis')
         prime = "'" if n=='a' and row in 'ud' else ""
         c.node(n+row, label=row+prime, width="1", shape='none', fontcolor=pcolor, group='clusters')
@@ -201,7 +230,7 @@ def add_ite(g,n, v, hi, lo):
     if lo!="*": g.edge(n+v, n+lo, style='dashed', color=edge_color(v))
 
 def row_order(g,n, cs):
-    for x, y in pairs(cs):
+    for x, y in pairwise(cs):
         g.edge(n+x, n+y, style='invis')
 
 def node_label(x:U[str,int])->(str,str):
@@ -216,15 +245,19 @@ def draw_scaffold(g,n, label, seq, ru=(), rd=(), ites=(), **kw):
     g.attr('edge', arrowsize='0.75')
     g.attr('node', shape='circle', width="0.4", fixedsize="true")
 
-    active = {node_label(x)[0] for vhl in ites for x in vhl}
+    # compute each node's (id, label) once, up front:
+    labels = {x: node_label(x) for vhl in ites for x in vhl}
+    active = {v[0] for v in labels.values()}
+    for x in (*ru, *rd): labels.setdefault(abs(x), node_label(abs(x)))
+
     add_row(g, n, 'z', active, ['z0', 'z1', 'z2', 'z3'], color=FADE, fontcolor=FADE)
-    add_row(g, n, 'd', active, [node_label(abs(x)) for x in rd])
-    add_row(g, n, 'u', active, [node_label(abs(x)) for x in ru])
+    add_row(g, n, 'd', active, [labels[abs(x)] for x in rd])
+    add_row(g, n, 'u', active, [labels[abs(x)] for x in ru])
     add_row(g, n, 'a', active, ['a0', 'a1', 'a2', 'a3'], color=FADE, fontcolor=FADE)
     row_order(g,n, seq)
 
     for ite in ites:
-        add_ite(g,n, *(node_label(x)[0] for x in ite))
+        add_ite(g,n, *(labels[x][0] for x in ite))
 
 
 def draw_ite_scaffold(label, before, after):
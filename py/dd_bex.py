@@ -0,0 +1,417 @@
+"""
+An implementation of the `dd` package's BDD interface
+(https://github.com/tulip-control/dd) on top of bex.
+
+The goal is to let you use bex as a drop-in replacement for
+`dd.autoref` in existing python code. Only a subset of the
+interface is implemented so far.
+"""
+import functools
+import logging
+
+import bex as _bex
+
+logger = logging.getLogger(__name__)
+
+try: import numpy as _np
+except ImportError: _np = None
+
+
+class BDDNode:
+    """a reference to a node in a BDD, bound to the BDD that owns it"""
+    __slots__ = ('bdd', 'nid', '_vhl_cache', '_hash')
+
+    def __init__(self, bdd, nid):
+        self.bdd = bdd
+        self.nid = nid
+        self._vhl_cache = None
+        self._hash = None
+
+    @property
+    def vhl(self):
+        """the (var, hi, lo) triple for this node.
+
+        The triple never changes for a given nid, so we only cross
+        into rust the first time, and cache the result."""
+        if self._vhl_cache is None:
+            self._vhl_cache = self.bdd._get_vhl(self.nid)
+        return self._vhl_cache
+
+    @property
+    def var(self):
+        """name of the branch variable, or None for constants"""
+        if self.nid.is_const(): return None
+        return self.bdd.var_name(self.vhl[0])
+
+    @property
+    def level(self):
+        if self.nid.is_const(): return self.bdd.var_count
+        return self.vhl[0]
+
+    @property
+    def high(self):
+        """the 'then' branch, or None for constants"""
+        if self.nid.is_const(): return None
+        return BDDNode(self.bdd, self.vhl[1])
+
+    @property
+    def low(self):
+        """the 'else' branch, or None for constants"""
+        if self.nid.is_const(): return None
+        return BDDNode(self.bdd, self.vhl[2])
+
+    @property
+    def negated(self):
+        return self.nid.is_inv()
+
+    def __invert__(self):
+        return BDDNode(self.bdd, ~self.nid)
+
+    def __and__(self, other):
+        # resolve the trivial cases here, without crossing into rust:
+        if self.nid == other.nid: return self
+        if self.nid == _bex.I: return other
+        if other.nid == _bex.I: return self
+        if self.nid == _bex.O or other.nid == _bex.O: return self.bdd.false
+        return BDDNode(self.bdd, self.bdd._op_and(self.nid, other.nid))
+
+    def __or__(self, other):
+        if self.nid == other.nid: return self
+        if self.nid == _bex.O: return other
+        if other.nid == _bex.O: return self
+        if self.nid == _bex.I or other.nid == _bex.I: return self.bdd.true
+        return BDDNode(self.bdd, self.bdd._op_or(self.nid, other.nid))
+
+    def __xor__(self, other):
+        return BDDNode(self.bdd, self.bdd._op_xor(self.nid, other.nid))
+
+    def __eq__(self, other):
+        # nid equality first: nids are hash-consed, so within one manager
+        # (the overwhelmingly common case) that single compare decides it.
+        return (other.__class__ is BDDNode
+                and self.nid == other.nid
+                and self.bdd is other.bdd)
+
+    def __hash__(self):
+        # nids hash by their packed integer value on the rust side; mixing
+        # in the manager id keeps nodes from different BDDs distinct. The
+        # result is memoized so repeated set/dict probes on the same
+        # wrapper cost one slot load, not a crossing.
+        h = self._hash
+        if h is None: h = self._hash = hash(self.nid) ^ id(self.bdd)
+        return h
+
+    def __str__(self): return str(self.nid)
+    def __repr__(self): return f'<BDDNode({self.nid!r})>'
+
+
+class Substitution:
+    """a variable substitution, precompiled to parallel vid/nid arrays for BDD.let"""
+    __slots__ = ('vids', 'nids')
+
+    def __init__(self, bdd, definitions):
+        self.vids = [bdd._to_vid(k) for k in definitions]
+        self.nids = [bdd._to_nid(v) for v in definitions.values()]
+
+
+class BDD:
+    """bex-backed replacement for dd.autoref.BDD"""
+    __slots__ = ('base', 'vars', '_names', '_var_nids', 'var_count',
+                 '_false', '_true',
+                 '_get_vhl', '_op_and', '_op_or', '_op_xor', '_ite', '_count')
+
+    def __init__(self):
+        self.base = _bex.BDD()
+        # nids are hash-consed on the rust side, so a (v,hi,lo) triple can
+        # never change out from under us -- no invalidation needed
+        # (unless variables are ever reordered; see _invalidate_caches).
+        self._get_vhl = functools.lru_cache(maxsize=65536)(self.base.get_vhl)
+        # rust memoizes these too, but a python-side cache hit skips the hop:
+        self._op_and = functools.lru_cache(maxsize=1 << 16)(self.base.op_and)
+        self._op_or = functools.lru_cache(maxsize=1 << 16)(self.base.op_or)
+        self._op_xor = functools.lru_cache(maxsize=1 << 16)(self.base.op_xor)
+        self._ite = functools.lru_cache(maxsize=1 << 16)(self.base.ite)
+        # counting is compute-bound and search loops re-count the same
+        # roots; (nid, nvars) keys never go stale, so this is safe:
+        self._count = functools.lru_cache(maxsize=1 << 14)(self.base.solution_count)
+        self.vars = {}      # name -> variable index (which is also the level, for now)
+        self._names = []    # variable index -> name (parallel to self.vars)
+        self._var_nids = [] # variable index -> nid, so lookups skip _bex.var()
+        self.var_count = 0
+        self._false = BDDNode(self, _bex.O)
+        self._true = BDDNode(self, _bex.I)
+
+    ## variables ##########################################################
+
+    def declare(self, *names):
+        # dict.fromkeys de-duplicates repeats within one call, in order:
+        new = [n for n in dict.fromkeys(names) if n not in self.vars]
+        if not new: return
+        # fetch all the new variable nids in one crossing:
+        start = self.var_count
+        self._var_nids.extend(_bex.vars_range(start, start + len(new)))
+        for name in new:
+            self.vars[name] = self.var_count
+            self._names.append(name)
+            self.var_count += 1
+
+    def add_var(self, name, level=None):
+        if name in self.vars: return self.vars[name]
+        if level is not None and level != self.var_count:
+            raise NotImplementedError('bex assigns levels in declaration order')
+        self.vars[name] = self.var_count
+        self._names.append(name)
+        self._var_nids.append(_bex.var(self.var_count))
+        self.var_count += 1
+        return self.vars[name]
+
+    def var(self, name):
+        return BDDNode(self, self._var_nids[self.vars[name]])
+
+    def var_name(self, vid):
+        try: return self._names[vid]
+        except IndexError: raise ValueError(f'unknown variable id: {vid}') from None
+
+    def var_at_level(self, level):
+        try: return self._names[level]
+        except IndexError: raise ValueError(f'no variable at level {level}') from None
+
+    def level_of_var(self, name):
+        return self.vars[name]
+
+    ## conversion helpers #################################################
+
+    # one dict lookup on type(x) instead of a chain of isinstance tests:
+    _NID_HANDLERS = {
+        BDDNode: lambda self, x: x.nid,
+        _bex.NID: lambda self, x: x,
+        str: lambda self, x: self._var_nids[self.vars[x]],
+        bool: lambda self, x: _bex.I if x else _bex.O}
+
+    _VID_HANDLERS = {
+        str: lambda self, x: self.vars[x],
+        int: lambda self, x: x}
+
+    def _to_nid(self, x):
+        """coerce x (a BDDNode, NID, variable name, or bool) to a NID"""
+        try: handler = self._NID_HANDLERS[type(x)]
+        except KeyError:
+            raise TypeError(f"don't know how to make a nid from {x!r}") from None
+        return handler(self, x)
+
+    def _to_vid(self, x):
+        """coerce x (a variable name or index) to a variable index"""
+        try: handler = self._VID_HANDLERS[type(x)]
+        except KeyError:
+            raise TypeError(f"don't know how to make a vid from {x!r}") from None
+        return handler(self, x)
+
+    ## constants ##########################################################
+
+    @property
+    def false(self): return self._false
+
+    @property
+    def true(self): return self._true
+
+    ## operations #########################################################
+
+    def succ_nids(self, u):
+        """return (level, low, high) with the branches as bare nids.
+
+        Traversal loops that only recurse on the result should prefer
+        this over succ: it skips two BDDNode allocations per step."""
+        v, hi, lo = u.vhl
+        return v, lo, hi
+
+    def succ(self, u):
+        """return (level, low, high) for the given node"""
+        v, lo, hi = self.succ_nids(u)
+        return v, BDDNode(self, lo), BDDNode(self, hi)
+
+    def succ_raw(self, u):
+        """like succ, but returns (level, low, high) as raw ints.
+
+        Use _bex.nid_from_raw to rewrap the ints when handing them
+        back out; until then a traversal allocates nothing per node."""
+        return self.base.succ_raw(self._to_nid(u))
+
+    def ite(self, g, u, v):
+        return BDDNode(self, self._ite(
+            self._to_nid(g), self._to_nid(u), self._to_nid(v)))
+
+    # one dict lookup per call instead of walking a chain of string patterns:
+    _APPLY_OPS = {alias: fn
+        for aliases, fn in (
+            (('not', '~', '!'), lambda self, u, v, w: ~u),
+            (('and', '&', '/\\'), lambda self, u, v, w: u & v),
+            (('or', '|', '\\/'), lambda self, u, v, w: u | v),
+            (('xor', '^'), lambda self, u, v, w: u ^ v),
+            (('implies', '=>', '->'), lambda self, u, v, w: ~u | v),
+            (('equiv', '<=>', '<->'), lambda self, u, v, w: ~(u ^ v)),
+            (('ite',), lambda self, u, v, w: self.ite(u, v, w)))
+        for alias in aliases}
+
+    def apply(self, op, u, v=None, w=None):
+        try: fn = self._APPLY_OPS[op]
+        except KeyError:
+            raise ValueError(f'unknown operator: {op!r}') from None
+        return fn(self, u, v, w)
+
+    def find_or_add(self, name, low, high):
+        """the node branching on `name` with the given children.
+
+        The name is from dd; in bex every ite is a find-or-add against
+        the hash-consed node table, so this is just ite with the
+        argument order rearranged."""
+        return self.ite(self.var(name), high, low)
+
+    def and_all(self, nodes):
+        """fold & over the nodes with a single rust call"""
+        return BDDNode(self, self.base.op_and_many([u.nid for u in nodes]))
+
+    def or_all(self, nodes):
+        """fold | over the nodes with a single rust call"""
+        return BDDNode(self, self.base.op_or_many([u.nid for u in nodes]))
+
+    def compile_let(self, definitions):
+        """precompile a substitution so repeated `let` calls skip the conversion pass"""
+        return Substitution(self, definitions)
+
+    def apply_let(self, sub, u):
+        """apply a precompiled Substitution to node u"""
+        return BDDNode(self, self.base.sub_many(sub.vids, sub.nids, u.nid))
+
+    def let(self, definitions, u):
+        """substitute variables with other nodes (or names, or constants).
+
+        Callers doing the same substitution in a loop should pass a
+        precompiled Substitution (see compile_let), which skips the
+        per-call conversion pass entirely."""
+        if definitions.__class__ is not Substitution:
+            definitions = Substitution(self, definitions)
+        return self.apply_let(definitions, u)
+
+    def quantify(self, u, qvars, forall=False):
+        # the whole elimination loop runs on the rust side (sharing its
+        # memo tables across variables), instead of 3 hops per variable:
+        vids = [self._to_vid(q) for q in qvars]
+        return BDDNode(self, self.base.quantify(u.nid, vids, forall))
+
+    def exist(self, qvars, u): return self.quantify(u, qvars, forall=False)
+    def forall(self, qvars, u): return self.quantify(u, qvars, forall=True)
+
+    def cube(self, dvars):
+        """conjunction of literals. dvars maps each name to a bool (or is a list of names)"""
+        items = dvars.items() if isinstance(dvars, dict) else [(x, True) for x in dvars]
+        # one crossing; the rust side sorts and folds bottom-up:
+        lits = [(self.vars[name], bool(val)) for name, val in items]
+        return BDDNode(self, self.base.conj_cube(lits))
+
+    ## solutions ##########################################################
+
+    def count(self, u, nvars=None):
+        """the number of satisfying assignments, over nvars variables"""
+        if nvars is None: nvars = self.var_count
+        # constants don't need an enumeration pass:
+        if u.nid.is_const(): return (1 << nvars) if u.nid == _bex.I else 0
+        return self._count(u.nid, nvars)
+
+    def pick_iter(self, u, care_vars=None):
+        """yield each satisfying assignment as a {name: bool} dict.
+
+        Solutions stream through a rust-side cursor, so the first one
+        costs a single descent and memory stays O(depth) no matter how
+        many assignments there are."""
+        if care_vars is not None and set(care_vars) != set(self._names):
+            raise NotImplementedError(
+                'bex enumerates over all declared variables')
+        names = tuple(self._names)
+        rows = _bex.solutions_iter(self.base, u.nid, self.var_count)
+        if _np is not None:
+            # bulk-decode each packed bitset row with SIMD unpackbits:
+            for row in rows:
+                bits = _np.unpackbits(_np.frombuffer(row, dtype=_np.uint8),
+                                      bitorder='little')[:self.var_count]
+                yield dict(zip(names, bits.astype(bool).tolist()))
+            return
+        for row in rows:
+            n = int.from_bytes(row, 'little')
+            yield {name: bool((n >> i) & 1) for i, name in enumerate(names)}
+
+    def pick_iter_array(self, u):
+        """all satisfying assignments at once, as an (S, V) bool matrix.
+
+        Column j corresponds to var_at_level(j). For bulk consumers this
+        skips the per-solution dict construction of pick_iter entirely:
+        one rust call for the packed rows, one unpackbits for the lot.
+        Unlike pick_iter this materializes the whole set by design --
+        don't use it when the solution count might be astronomical."""
+        if _np is None:
+            raise ImportError('pick_iter_array requires numpy')
+        rows = self.base.solutions_bytes(u.nid, self.var_count)
+        nbytes = (self.var_count + 7) // 8
+        packed = _np.frombuffer(b''.join(rows), dtype=_np.uint8)
+        bits = _np.unpackbits(packed.reshape(len(rows), nbytes),
+                              axis=1, bitorder='little')
+        return bits[:, :self.var_count].astype(bool)
+
+    def pick(self, u, care_vars=None):
+        return next(self.pick_iter(u, care_vars), None)
+
+    ## structure ##########################################################
+
+    def _walk_df(self, u):
+        """yield (nid, v, hi, lo) for each reachable node exactly once, children first.
+
+        The whole traversal happens in one rust call; the tuples hold
+        raw int nids (rewrap with _bex.nid_from_raw as needed), so
+        iterating costs no FFI and no allocation per node."""
+        nid = u.nid if isinstance(u, BDDNode) else u
+        return iter(self.base.walk_df_batch(nid))
+
+    def copy(self, u, other):
+        """transfer node u to the BDD `other`, and return the new node"""
+        if u.nid.is_const(): return BDDNode(other, u.nid)
+        rows = self.base.walk_df_batch(u.nid)
+        vmap = None
+        if self._names != other._names[:self.var_count]:
+            # other declared the shared variables at different levels, so
+            # hand ite_many a renumbering (it has to apply to the var
+            # leaves inside the rows as well, not just the branch vars):
+            vmap = [other.vars[name] for name in self._names]
+        return BDDNode(other, other.base.ite_many(rows, vmap))
+
+    def support(self, u, as_levels=False):
+        """the set of variable names (or levels) on which node u depends"""
+        if u.nid.is_const(): return set()
+        ixs = {v for _nid, v, _h, _l in self._walk_df(u)}
+        return ixs if as_levels else {self._names[i] for i in ixs}
+
+    def to_expr(self, u):
+        # recurse on bare nids: no wrapper allocations, and the vhl
+        # lookups come out of the shared lru cache after the first visit.
+        def expr(nid):
+            if nid == _bex.O: return 'FALSE'
+            if nid == _bex.I: return 'TRUE'
+            v, hi, lo = self._get_vhl(nid)
+            return f'ite({self._names[v]}, {expr(hi)}, {expr(lo)})'
+        return expr(self._to_nid(u))
+
+    def _invalidate_caches(self):
+        """drop all python-side memoized results.
+
+        Only needed if node identities ever change (i.e. a future
+        reorder); normal construction never invalidates anything."""
+        for cache in (self._get_vhl, self._op_and, self._op_or,
+                      self._op_xor, self._ite, self._count):
+            cache.cache_clear()
+
+    def reorder(self, order=None):
+        logger.debug('bex does not support dynamic reordering (yet)')
+        self._invalidate_caches()
+
+    def __contains__(self, u):
+        # nodes hold a direct reference to their owning manager, so
+        # identity is the whole question -- no __eq__ dispatch needed:
+        return u.bdd is self
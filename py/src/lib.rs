@@ -1,13 +1,84 @@
 ///! wrap bex as a python module
 extern crate bex;
+use std::collections::HashMap;
 use pyo3::prelude::*;
-use pyo3::PyObjectProtocol;
-use pyo3::exceptions::PyException;
-use bex::{Base, GraphViz, ast::ASTBase, nid::{I,O,NID}, vid::VID};
+use pyo3::{PyObjectProtocol, PyNumberProtocol, PyIterProtocol};
+use pyo3::class::basic::CompareOp;
+use pyo3::AsPyPointer;
+use pyo3::exceptions::{PyException, PyValueError};
+use pyo3::types::PyBytes;
+use bex::{Base, GraphViz, ast::ASTBase, bdd::BDDBase, nid::{I,O,NID}, vid::VID,
+          reg::Reg, vhl::Walkable};
 
 #[pyclass(name="NID")] struct PyNID{ nid:NID }
 #[pyclass(name="VID")] struct PyVID{ vid:VID }
 #[pyclass(name="AST")] struct PyAST { base: ASTBase }
+#[pyclass(name="BDD")] struct PyBDD { base: BDDBase }
+
+/// a node allocated on the rust side: nid + handle to the BDD that owns it.
+/// cheaper to create than a python-level wrapper, for traversal-heavy loops.
+#[pyclass(name="BddNode")] struct PyNode { bdd: Py<PyBDD>, nid: NID }
+
+/// depth-first enumerator for the solutions of a nid. walks lo-then-hi
+/// paths to the I leaf, then ripples a counter over the variables the
+/// path left unfixed, so the first solution costs one descent and each
+/// next() is O(depth). (this deliberately sidesteps the core crate's
+/// Cursor/next_solution, whose enumeration skips assignments for some
+/// variable orders -- see test_pick_iter_complete in py/test_dd_bex.py.)
+struct SolCursor {
+  nvars: usize,
+  stack: Vec<(NID, u8)>,  // (node, next branch to try: 0=lo, 1=hi, 2=done)
+  scope: Reg,             // the current assignment
+  fixed: Reg,             // which vars the current path has branched on
+  free: Vec<usize>,       // unfixed var indices at the current leaf
+  at_leaf: bool,          // scope was just emitted; ripple `free` for more
+  fresh_i: bool,          // the root itself is I and hasn't been emitted yet
+  done: bool }
+
+impl SolCursor {
+  fn new(n:NID, nvars:usize)->SolCursor {
+    let mut cur = SolCursor {
+      nvars, stack: vec![], scope: Reg::new(nvars), fixed: Reg::new(nvars),
+      free: vec![], at_leaf: false, fresh_i: false, done: false };
+    if n == O { cur.done = true }
+    else if n == I { cur.fresh_i = true }
+    else { cur.stack.push((n, 0)) }
+    cur }
+
+  fn enter_leaf(&mut self) {
+    self.free = (0..self.nvars).filter(|&i| !self.fixed.get(i)).collect();
+    self.at_leaf = true }
+
+  fn advance(&mut self, base:&mut BDDBase)->Option<Reg> {
+    if self.done { return None }
+    if self.fresh_i {
+      self.fresh_i = false; self.enter_leaf();
+      return Some(self.scope.clone()) }
+    if self.at_leaf {
+      // ripple-increment the counter formed by the free vars:
+      for &i in &self.free {
+        if self.scope.get(i) { self.scope.put(i, false) }
+        else { self.scope.put(i, true); return Some(self.scope.clone()) }}
+      self.at_leaf = false }  // every expansion emitted; resume the dfs
+    loop {
+      let (n, branch) = match self.stack.last_mut() {
+        None => { self.done = true; return None }
+        Some(&mut (n, ref mut next)) => { let b = *next; *next += 1; (n, b) }};
+      let v = n.vid();
+      let child = match branch {
+        0 => { self.fixed.var_put(v, true); self.scope.var_put(v, false);
+               base.when_lo(v, n) }
+        1 => { self.scope.var_put(v, true); base.when_hi(v, n) }
+        _ => { self.fixed.var_put(v, false); self.scope.var_put(v, false);
+               self.stack.pop(); continue }};
+      if child == O { continue }
+      if child == I { self.enter_leaf(); return Some(self.scope.clone()) }
+      self.stack.push((child, 0)) }}}
+
+/// streaming python iterator over solutions: each next() yields one
+/// packed little-endian assignment (the row format of solutions_bytes)
+/// without ever materializing the whole solution set.
+#[pyclass(name="Solutions")] struct PySolutions { bdd: Py<PyBDD>, cur: SolCursor }
 
 enum BexErr { NegVar, NegVir }
 impl std::convert::From<BexErr> for PyErr {
@@ -21,12 +92,32 @@ impl PyNID {
   #[staticmethod]
   fn var(i:i32)->PyResult<Self> { if i<0 { Err(BexErr::NegVar.into()) } else { Ok(PyNID{ nid:NID::var(i as u32)}) }}
   #[staticmethod]
-  fn vir(i:i32)->PyResult<Self> { if i<0 { Err(BexErr::NegVir.into()) } else { Ok(PyNID{ nid:NID::vir(i as u32)}) }}}
+  fn vir(i:i32)->PyResult<Self> { if i<0 { Err(BexErr::NegVir.into()) } else { Ok(PyNID{ nid:NID::vir(i as u32)}) }}
+  fn is_const(&self)->bool { self.nid.is_const() }
+  fn is_inv(&self)->bool { self.nid.is_inv() }
+  fn is_var(&self)->bool { self.nid.is_var() }
+  fn to_raw(&self)->u64 { self.nid.to_raw() }}
 
 #[pyproto]
 impl PyObjectProtocol for PyNID {
   fn __str__(&self) -> String { self.nid.to_string() }
-  fn __repr__(&self) -> String { format!("<NID({:?})>", self.nid).to_string() }}
+  fn __repr__(&self) -> String { format!("<NID({:?})>", self.nid).to_string() }
+  fn __hash__(&self) -> isize {
+    use std::collections::hash_map::DefaultHasher;
+    use std::hash::{Hash, Hasher};
+    let mut h = DefaultHasher::new(); self.nid.hash(&mut h); h.finish() as isize }
+  fn __richcmp__(&self, other:PyRef<PyNID>, op:CompareOp) -> bool {
+    match op {
+      CompareOp::Eq => self.nid == other.nid,
+      CompareOp::Ne => self.nid != other.nid,
+      CompareOp::Lt => self.nid < other.nid,
+      CompareOp::Le => self.nid <= other.nid,
+      CompareOp::Gt => self.nid > other.nid,
+      CompareOp::Ge => self.nid >= other.nid }}}
+
+#[pyproto]
+impl PyNumberProtocol for PyNID {
+  fn __invert__(&self) -> PyNID { PyNID{ nid: !self.nid }}}
 
 #[pyproto]
 impl PyObjectProtocol for PyVID {
@@ -41,15 +132,239 @@ impl PyAST {
   fn op_or(&mut self, x:&PyNID, y:&PyNID)->PyNID  { PyNID{ nid:self.base.or(x.nid, y.nid) }}
   fn to_dot(&self, x:&PyNID)->String { let mut s = String::new(); self.base.write_dot(x.nid, &mut s); s }}
 
+#[pymethods]
+impl PyBDD {
+  #[new] fn __new__()->Self { Self{ base: BDDBase::new() }}
+  fn op_and(&mut self, x:&PyNID, y:&PyNID)->PyNID { PyNID{ nid:self.base.and(x.nid, y.nid) }}
+  fn op_xor(&mut self, x:&PyNID, y:&PyNID)->PyNID { PyNID{ nid:self.base.xor(x.nid, y.nid) }}
+  fn op_or(&mut self, x:&PyNID, y:&PyNID)->PyNID  { PyNID{ nid:self.base.or(x.nid, y.nid) }}
+  fn ite(&mut self, f:&PyNID, g:&PyNID, h:&PyNID)->PyNID { PyNID{ nid:self.base.ite(f.nid, g.nid, h.nid) }}
+  /// fold AND over a whole list of nids in one call
+  fn op_and_many(&mut self, xs:Vec<PyRef<PyNID>>)->PyNID {
+    let mut res = I;
+    for x in xs { res = self.base.and(res, x.nid); if res == O { break }}
+    PyNID{ nid:res }}
+  /// fold OR over a whole list of nids in one call
+  fn op_or_many(&mut self, xs:Vec<PyRef<PyNID>>)->PyNID {
+    let mut res = O;
+    for x in xs { res = self.base.or(res, x.nid); if res == I { break }}
+    PyNID{ nid:res }}
+  /// return the (var, hi, lo) triple for a (non-constant) node
+  fn get_vhl(&mut self, x:&PyNID)->PyResult<(usize, PyNID, PyNID)> {
+    if x.nid.is_const() { return Err(PyException::new_err("constant nids have no (v,hi,lo)")) }
+    let v = x.nid.vid();
+    let hi = self.base.when_hi(v, x.nid);
+    let lo = self.base.when_lo(v, x.nid);
+    Ok((v.var_ix(), PyNID{nid:hi}, PyNID{nid:lo})) }
+  /// like get_vhl, but returns (level, low, high) as raw ints, so tight
+  /// python loops can traverse without allocating a wrapper per node.
+  fn succ_raw(&mut self, x:&PyNID)->PyResult<(usize, u64, u64)> {
+    if x.nid.is_const() { return Err(PyException::new_err("constant nids have no successors")) }
+    let v = x.nid.vid();
+    let hi = self.base.when_hi(v, x.nid);
+    let lo = self.base.when_lo(v, x.nid);
+    Ok((v.var_ix(), lo.to_raw(), hi.to_raw())) }
+  fn when_hi(&mut self, v:usize, x:&PyNID)->PyNID { PyNID{ nid:self.base.when_hi(VID::var(v as u32), x.nid) }}
+  fn when_lo(&mut self, v:usize, x:&PyNID)->PyNID { PyNID{ nid:self.base.when_lo(VID::var(v as u32), x.nid) }}
+  /// build a conjunction of (var_ix, positive) literals in one call.
+  /// sorting and folding from the lowest variable up keeps each step
+  /// cheap: higher variables sit nearer the root, so every `and` just
+  /// hangs a new root above the cube built so far.
+  fn conj_cube(&mut self, mut lits:Vec<(usize, bool)>)->PyNID {
+    lits.sort_unstable();
+    let mut res = I;
+    for &(v, pos) in lits.iter() {
+      let x = NID::var(v as u32);
+      res = self.base.and(if pos { x } else { !x }, res); }
+    PyNID{ nid:res }}
+  /// quantify out a whole set of variables in one call: existentially
+  /// (or over the restrictions) by default, universally with forall=true.
+  fn quantify(&mut self, x:&PyNID, vids:Vec<usize>, forall:bool)->PyNID {
+    let mut res = x.nid;
+    for v in vids {
+      let v = VID::var(v as u32);
+      let hi = self.base.when_hi(v, res);
+      let lo = self.base.when_lo(v, res);
+      res = if forall { self.base.and(hi, lo) } else { self.base.or(hi, lo) }}
+    PyNID{ nid:res }}
+  /// replace var v with node n in context ctx
+  fn sub(&mut self, v:usize, n:&PyNID, ctx:&PyNID)->PyNID {
+    PyNID{ nid:self.base.sub(VID::var(v as u32), n.nid, ctx.nid) }}
+  /// apply a whole set of substitutions (parallel vid/nid arrays) in one
+  /// call, simultaneously: each target var is first renamed to a fresh
+  /// temporary above everything in play, so one replacement can never be
+  /// rewritten by a later one (e.g. the swap {x:y, y:x} really swaps).
+  fn sub_many(&mut self, vs:Vec<usize>, ns:Vec<PyRef<PyNID>>, ctx:&PyNID)->PyNID {
+    // roots carry the topmost variable, so they bound everything below:
+    let top = |n:NID| if n.is_const() { 0 } else { n.vid().var_ix() + 1 };
+    let mut tmp = top(ctx.nid);
+    for n in ns.iter() { tmp = tmp.max(top(n.nid)) }
+    for &v in vs.iter() { tmp = tmp.max(v + 1) }
+    let mut res = ctx.nid;
+    for (i, &v) in vs.iter().enumerate() {
+      res = self.base.sub(VID::var(v as u32), NID::var((tmp + i) as u32), res); }
+    for (i, n) in ns.iter().enumerate() {
+      res = self.base.sub(VID::var((tmp + i) as u32), n.nid, res); }
+    PyNID{ nid:res }}
+  fn node_count(&self, x:&PyNID)->usize { self.base.node_count(x.nid) }
+  /// depth-first walk of the whole reachable subgraph in a single call.
+  /// returns (nid, v, hi, lo) tuples of raw ints, children before parents.
+  fn walk_df_batch(&self, x:&PyNID)->Vec<(u64, usize, u64, u64)> {
+    let mut res = vec![];
+    if !x.nid.is_const() {
+      self.base.walk_up(x.nid, &mut |n,v,hi,lo| {
+        if !n.is_const() { res.push((n.to_raw(), v.var_ix(), hi.to_raw(), lo.to_raw())) }}); }
+    res }
+  /// rebuild a batch of (old_raw, v, hi_raw, lo_raw) rows in this base and
+  /// return the nid for the last row. the rows must come children before
+  /// parents (walk_df_batch's order); unmapped children are constants or
+  /// variable leaves. the whole rebuild is one call instead of one ite
+  /// per node. vmap, when given, renumbers every variable (branch vars
+  /// and var leaves alike) for bases with different declaration orders.
+  fn ite_many(&mut self, items:Vec<(u64, usize, u64, u64)>, vmap:Option<Vec<usize>>)->PyNID {
+    let tr = |raw:u64, map:&HashMap<u64, NID>| -> NID {
+      if let Some(&n) = map.get(&raw) { return n }
+      let n = NID::from_raw(raw);
+      if let Some(vm) = &vmap {
+        if n.is_var() {
+          let t = NID::var(vm[n.vid().var_ix()] as u32);
+          return if n.is_inv() { !t } else { t } }}
+      n };
+    let mut map:HashMap<u64, NID> = HashMap::with_capacity(items.len());
+    let mut res = O;
+    for (old, v, h0, l0) in items {
+      let v = if let Some(vm) = &vmap { vm[v] } else { v };
+      let hi = tr(h0, &map);
+      let lo = tr(l0, &map);
+      res = self.base.ite(NID::var(v as u32), hi, lo);
+      map.insert(old, res); }
+    PyNID{ nid:res }}
+  /// all solutions over nvars variables, as lists of the indices of the high bits
+  fn solutions(&mut self, x:&PyNID, nvars:usize)->Vec<Vec<usize>> {
+    let mut cur = SolCursor::new(x.nid, nvars);
+    let mut res = vec![];
+    while let Some(reg) = cur.advance(&mut self.base) { res.push(reg.hi_bits()) }
+    res }
+  /// all solutions over nvars variables, one packed little-endian bitset per row.
+  /// suited to bulk decoding (e.g. numpy's unpackbits) on the python side.
+  /// this materializes the whole set; prefer solutions_iter for streaming.
+  fn solutions_bytes(&mut self, py:Python, x:&PyNID, nvars:usize)->Vec<Py<PyBytes>> {
+    let mut cur = SolCursor::new(x.nid, nvars);
+    let mut res = vec![];
+    while let Some(reg) = cur.advance(&mut self.base) {
+      res.push(PyBytes::new(py, &reg.as_bytes()).into()) }
+    res }
+  /// the number of solutions over nvars variables. this is a
+  /// children-first dp over the graph -- one weight per node -- so it's
+  /// O(nodes), not an enumeration of the (possibly 2^nvars) assignments.
+  fn solution_count(&mut self, x:&PyNID, nvars:usize)->PyResult<u128> {
+    let n = x.nid;
+    if n == I { return Ok(1u128 << nvars) }
+    if n == O { return Ok(0) }
+    // the final shift below underflows (and the u128 shift then wraps)
+    // unless nvars covers every variable in the graph:
+    if nvars <= n.vid().var_ix() {
+      return Err(PyValueError::new_err(format!(
+        "nvars={} too small for a node branching on {:?}", nvars, n.vid()))) }
+    // weight(c): solutions over the vars at or below c (var_ix+1 of them),
+    // promoted to the `top` vars of the asking parent's branch.
+    let weight = |counts:&HashMap<NID,u128>, c:NID, top:usize| -> u128 {
+      if c == O { 0 }
+      else if c == I { 1u128 << top }
+      else { counts[&c] << (top - c.vid().var_ix() - 1) }};
+    let mut counts:HashMap<NID,u128> = HashMap::new();
+    self.base.walk_up(n, &mut |nid, v, hi, lo| {
+      let vi = v.var_ix();
+      let w = weight(&counts, hi, vi) + weight(&counts, lo, vi);
+      counts.insert(nid, w); });
+    Ok(counts[&n] << (nvars - n.vid().var_ix() - 1)) }
+  fn to_dot(&self, x:&PyNID)->String { let mut s = String::new(); self.base.write_dot(x.nid, &mut s); s }}
+
+#[pymethods]
+impl PyNode {
+  #[getter] fn nid(&self)->PyNID { PyNID{ nid:self.nid }}
+  fn is_const(&self)->bool { self.nid.is_const() }
+  /// return (var, hi, lo) with the branches wrapped as BddNodes
+  fn succ(&self, py:Python)->PyResult<(usize, PyNode, PyNode)> {
+    if self.nid.is_const() { return Err(PyException::new_err("constant nids have no successors")) }
+    let v = self.nid.vid();
+    let (hi, lo) = { let mut b = self.bdd.try_borrow_mut(py)?;
+      (b.base.when_hi(v, self.nid), b.base.when_lo(v, self.nid)) };
+    Ok((v.var_ix(),
+        PyNode{ bdd:self.bdd.clone_ref(py), nid:hi },
+        PyNode{ bdd:self.bdd.clone_ref(py), nid:lo })) }}
+
+#[pyproto]
+impl PyObjectProtocol for PyNode {
+  fn __str__(&self) -> String { self.nid.to_string() }
+  fn __repr__(&self) -> String { format!("<BddNode({:?})>", self.nid).to_string() }
+  fn __richcmp__(&self, other:PyRef<PyNode>, op:CompareOp) -> PyResult<bool> {
+    // nids are only meaningful within their owning base, so equality
+    // requires the same base object, like the python-level BDDNode.__eq__:
+    let eq = self.nid == other.nid && self.bdd.as_ptr() == other.bdd.as_ptr();
+    match op {
+      CompareOp::Eq => Ok(eq),
+      CompareOp::Ne => Ok(!eq),
+      _ => Err(PyException::new_err("BddNodes are not ordered")) }}}
+
+/// the rhs nid would be meaningless against the lhs's base, so binary
+/// ops refuse to mix nodes from different BDD objects.
+fn check_same_base(lhs:&PyNode, rhs:&PyNode)->PyResult<()> {
+  if lhs.bdd.as_ptr() == rhs.bdd.as_ptr() { Ok(()) }
+  else { Err(PyValueError::new_err("BddNode operands belong to different BDDs")) }}
+
+#[pyproto]
+impl<'p> PyNumberProtocol<'p> for PyNode {
+  fn __invert__(&self) -> PyNode {
+    let gil = Python::acquire_gil(); let py = gil.python();
+    PyNode{ bdd:self.bdd.clone_ref(py), nid:!self.nid }}
+  fn __and__(lhs:PyRef<'p,PyNode>, rhs:PyRef<'p,PyNode>) -> PyResult<PyNode> {
+    check_same_base(&lhs, &rhs)?;
+    let py = lhs.py();
+    let nid = { let mut b = lhs.bdd.try_borrow_mut(py)?; b.base.and(lhs.nid, rhs.nid) };
+    Ok(PyNode{ bdd:lhs.bdd.clone_ref(py), nid }) }
+  fn __or__(lhs:PyRef<'p,PyNode>, rhs:PyRef<'p,PyNode>) -> PyResult<PyNode> {
+    check_same_base(&lhs, &rhs)?;
+    let py = lhs.py();
+    let nid = { let mut b = lhs.bdd.try_borrow_mut(py)?; b.base.or(lhs.nid, rhs.nid) };
+    Ok(PyNode{ bdd:lhs.bdd.clone_ref(py), nid }) }
+  fn __xor__(lhs:PyRef<'p,PyNode>, rhs:PyRef<'p,PyNode>) -> PyResult<PyNode> {
+    check_same_base(&lhs, &rhs)?;
+    let py = lhs.py();
+    let nid = { let mut b = lhs.bdd.try_borrow_mut(py)?; b.base.xor(lhs.nid, rhs.nid) };
+    Ok(PyNode{ bdd:lhs.bdd.clone_ref(py), nid }) }}
+
+#[pyproto]
+impl PyIterProtocol for PySolutions {
+  fn __iter__(slf: PyRefMut<Self>)->Py<PySolutions> { slf.into() }
+  fn __next__(mut slf: PyRefMut<Self>)->PyResult<Option<Py<PyBytes>>> {
+    let gil = Python::acquire_gil(); let py = gil.python();
+    let bdd = slf.bdd.clone_ref(py);
+    let mut b = bdd.try_borrow_mut(py)?;
+    Ok(slf.cur.advance(&mut b.base)
+       .map(|reg| PyBytes::new(py, &reg.as_bytes()).into())) }}
+
 #[pymodule]
 fn bex(py:Python, m:&PyModule)->PyResult<()> {
   m.add_class::<PyVID>()?;
   m.add_class::<PyNID>()?;
   m.add_class::<PyAST>()?;
+  m.add_class::<PyBDD>()?;
+  m.add_class::<PyNode>()?;
+  m.add_class::<PySolutions>()?;
   m.setattr("O", PyNID{nid:O}.into_py(py))?;
   m.setattr("I", PyNID{nid:I}.into_py(py))?;
 
   #[pyfn(m, "var")] fn var(_py:Python, i:i32)->PyResult<PyNID> { PyNID::var(i) }
   #[pyfn(m, "vir")] fn vir(_py:Python, i:i32)->PyResult<PyNID> { PyNID::vir(i) }
+  #[pyfn(m, "wrap_nid")] fn wrap_nid(_py:Python, bdd:Py<PyBDD>, x:&PyNID)->PyNode {
+    PyNode{ bdd, nid:x.nid }}
+  #[pyfn(m, "solutions_iter")]
+  fn solutions_iter(_py:Python, bdd:Py<PyBDD>, x:&PyNID, nvars:usize)->PySolutions {
+    PySolutions{ bdd, cur: SolCursor::new(x.nid, nvars) }}
+  #[pyfn(m, "vars_range")] fn vars_range(_py:Python, a:u32, b:u32)->Vec<PyNID> {
+    (a..b).map(|i| PyNID{ nid:NID::var(i) }).collect() }
+  #[pyfn(m, "nid_from_raw")] fn nid_from_raw(_py:Python, n:u64)->PyNID {
+    PyNID{ nid:NID::from_raw(n) }}
 
   Ok(())}
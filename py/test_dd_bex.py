@@ -0,0 +1,227 @@
+"""
+tests for the dd_bex wrapper. run with `python test_dd_bex.py` (or
+pytest). requires the compiled bex module, like test.py.
+
+most checks cross-check BDD results against brute-force truth tables
+over a handful of variables -- exactly the scale where the sequential
+`let` and dropped-solution bugs used to hide.
+"""
+from itertools import product
+
+import bex as _bex
+from dd_bex import BDD
+
+
+def fresh(*names):
+    bdd = BDD()
+    bdd.declare(*names)
+    return bdd
+
+
+def ev(u, asn):
+    """evaluate node u under the {name: bool} assignment by walking down"""
+    while u.var is not None:
+        u = u.high if asn[u.var] else u.low
+    return u == u.bdd.true
+
+
+def assignments(names):
+    """every {name: bool} assignment over the given variable names"""
+    for bits in product([False, True], repeat=len(names)):
+        yield dict(zip(names, bits))
+
+
+def test_ops():
+    bdd = fresh('x', 'y', 'z')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    for u, fn in [
+            (x & y, lambda a: a['x'] and a['y']),
+            (x | ~z, lambda a: a['x'] or not a['z']),
+            (x ^ y, lambda a: a['x'] != a['y']),
+            (bdd.ite(z, x, y), lambda a: a['x'] if a['z'] else a['y']),
+            (bdd.apply('implies', x, y), lambda a: not a['x'] or a['y']),
+            (bdd.and_all([x, y, ~z]), lambda a: a['x'] and a['y'] and not a['z']),
+            (bdd.or_all([x, ~y]), lambda a: a['x'] or not a['y'])]:
+        for a in assignments('xyz'):
+            assert ev(u, a) == fn(a), (u, a)
+
+
+def test_constants():
+    bdd = fresh('x')
+    x = bdd.var('x')
+    assert bdd.true is bdd.true  # cached singletons
+    assert (x | ~x) == bdd.true
+    assert (x & ~x) == bdd.false
+    assert x in bdd
+    assert bdd.count(bdd.true, nvars=0) == 1
+
+
+def test_let_swap():
+    # `let` must substitute simultaneously: {x:y, y:x} really swaps.
+    bdd = fresh('x', 'y')
+    x, y = bdd.var('x'), bdd.var('y')
+    assert bdd.let({'x': y, 'y': x}, x & ~y) == (y & ~x)
+    # chained renames must not cascade either:
+    bdd = fresh('x', 'y', 'z')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    assert bdd.let({'x': y, 'y': z}, x & y) == (y & z)
+    # and a precompiled substitution behaves the same:
+    sub = bdd.compile_let({'x': y, 'y': x})
+    assert bdd.let(sub, x & ~y) == (y & ~x)
+
+
+def test_quantify():
+    bdd = fresh('x', 'y', 'z')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    u = (x & y) | z
+    ex = bdd.exist(['y'], u)
+    fa = bdd.forall(['y'], u)
+    for a in assignments('xz'):
+        hi, lo = ev(u, dict(a, y=True)), ev(u, dict(a, y=False))
+        assert ev(ex, a) == (hi or lo)
+        assert ev(fa, a) == (hi and lo)
+
+
+def test_cube():
+    bdd = fresh('x', 'y', 'z')
+    u = bdd.cube({'x': True, 'z': False})
+    v = bdd.cube(['y', 'z'])
+    for a in assignments('xyz'):
+        assert ev(u, a) == (a['x'] and not a['z'])
+        assert ev(v, a) == (a['y'] and a['z'])
+
+
+def test_wide_cube():
+    # a wide cube should build in linear time (regression: the fold once
+    # ran highest-variable-first, which was quadratic)
+    names = ['w%i' % i for i in range(300)]
+    bdd = fresh(*names)
+    u = bdd.cube({n: (i % 2 == 0) for i, n in enumerate(names)})
+    assert bdd.count(u) == 1
+
+
+def test_count():
+    bdd = fresh('x', 'y', 'z')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    assert bdd.count(bdd.true) == 8
+    assert bdd.count(bdd.false) == 0
+    assert bdd.count(x & y) == 2
+    assert bdd.count((x ^ y) | ~z) == 6
+    assert bdd.count(x, nvars=1) == 1
+    # counting is a dp over the graph, not an enumeration:
+    big = fresh(*['v%i' % i for i in range(28)])
+    assert big.count(big.var('v0')) == 2 ** 27
+    # nvars that doesn't cover the node's top variable is an error,
+    # not a wrapped shift (regression: this once returned 2**127):
+    try: bdd.count(x & y, nvars=1)
+    except ValueError: pass
+    else: assert False, 'count must reject nvars below the top variable'
+
+
+def test_pick():
+    # pick only pays for the first solution, even in a huge space
+    big = fresh(*['v%i' % i for i in range(28)])
+    asn = big.pick(big.var('v5'))
+    assert asn['v5']
+    assert big.pick(big.false) is None
+
+
+def test_pick_iter_complete():
+    # regression: the core crate's cursor iterator drops assignments for
+    # this variable order (it lost {x:F, y:T, z:F})
+    bdd = fresh('z', 'y', 'x')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    u = (x ^ y) | ~z
+    expect = {frozenset(a.items()) for a in assignments('xyz')
+              if a['x'] != a['y'] or not a['z']}
+    got = [frozenset(a.items()) for a in bdd.pick_iter(u)]
+    assert len(got) == len(expect) == 6
+    assert set(got) == expect
+    assert bdd.count(u) == 6
+
+
+def test_pick_care_vars():
+    # we always enumerate over every declared variable, so care_vars is
+    # only accepted when it says exactly that:
+    bdd = fresh('x', 'y')
+    x = bdd.var('x')
+    assert bdd.pick(x, care_vars=['y', 'x'])['x']
+    try: bdd.pick(x, care_vars=['x'])
+    except NotImplementedError: pass
+    else: assert False, 'partial care_vars must not be silently ignored'
+
+
+def test_pick_iter_array():
+    try: import numpy  # noqa: F401
+    except ImportError: return
+    bdd = fresh('x', 'y')
+    arr = bdd.pick_iter_array(bdd.var('x'))
+    assert arr.shape == (2, 2)
+    assert all(row[0] for row in arr.tolist())  # column 0 is x
+
+
+def test_copy():
+    a = fresh('x', 'y', 'z')
+    x, y, z = a.var('x'), a.var('y'), a.var('z')
+    for u in [(x & ~y) | z, x | y, x ^ y ^ z, a.true, a.false]:
+        for other in [fresh('x', 'y', 'z'),  # same declaration order
+                      fresh('z', 'y', 'x')]: # renumbering path
+            v = a.copy(u, other)
+            assert v in other
+            for asn in assignments('xyz'):
+                assert ev(v, asn) == ev(u, asn), (u, other._names, asn)
+
+
+def test_bddnode():
+    # smoke test for the rust-side BddNode wrapper
+    bdd = fresh('x', 'y')
+    x, y = bdd.var('x'), bdd.var('y')
+    a = _bex.wrap_nid(bdd.base, x.nid)
+    b = _bex.wrap_nid(bdd.base, y.nid)
+    u = (a & b) | ~a
+    assert not u.is_const()
+    assert u.nid == bdd.apply('implies', x, y).nid
+    v, hi, lo = u.succ()
+    assert v == 1  # branches on y, the var nearest the root
+    # equality is (nid, owning base), like BDDNode.__eq__:
+    assert a == _bex.wrap_nid(bdd.base, x.nid)
+    other = fresh('x', 'y')
+    c = _bex.wrap_nid(other.base, other.var('x').nid)
+    assert a != c
+    # and mixing bases in a binary op is an error, not a garbage node:
+    try: a & c
+    except ValueError: pass
+    else: assert False, 'cross-BDD operands must be rejected'
+
+
+def test_support():
+    bdd = fresh('x', 'y', 'z')
+    x, y, z = bdd.var('x'), bdd.var('y'), bdd.var('z')
+    assert bdd.support((x & y) | z) == {'x', 'y', 'z'}
+    assert bdd.support(x & y) == {'x', 'y'}
+    assert bdd.support(bdd.true) == set()
+
+
+def test_to_expr():
+    bdd = fresh('x', 'y')
+    assert bdd.to_expr(bdd.true) == 'TRUE'
+    assert bdd.to_expr(bdd.var('x')) == 'ite(x, TRUE, FALSE)'
+
+
+def test_declare_dedup():
+    bdd = BDD()
+    bdd.declare('a', 'a', 'b')
+    assert bdd.var_count == 2
+    assert bdd.var_at_level(0) == 'a'
+    assert bdd.var_at_level(1) == 'b'
+    bdd.declare('b', 'c')
+    assert bdd.var_count == 3
+
+
+if __name__ == '__main__':
+    import sys
+    this = sys.modules['__main__']
+    for name in sorted(dir(this)):
+        if name.startswith('test_'):
+            getattr(this, name)()
+            print(name, 'ok')
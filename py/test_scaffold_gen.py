@@ -0,0 +1,51 @@
+"""
+regenerate src/test-swap-scaffold.rs from the diagrams in
+doc/scaffold.ipynb and check that the output is byte-identical to the
+checked-in file, so edits to the generator can't silently drift the
+generated rust test suite.
+
+this doesn't need the compiled bex module, and graphviz is stubbed out
+when it isn't installed, so it runs anywhere python runs.
+"""
+import json
+import os
+import sys
+import types
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DOC = os.path.join(HERE, '..', 'doc')
+SRC = os.path.join(HERE, '..', 'src')
+
+
+def test_generated_tests_match():
+    try: import graphviz  # noqa: F401
+    except ImportError:
+        stub = types.ModuleType('graphviz')
+        stub.Graph = type('Graph', (), {})
+        stub.Digraph = type('Digraph', (), {})
+        sys.modules['graphviz'] = stub
+    sys.path.insert(0, DOC)
+    try:
+        import scaffold_graph_tests as gen
+        gen.RUST_TESTS.clear()
+        # replay the notebook's diagram cells, recording tests only:
+        env = {name: getattr(gen, name) for name in dir(gen)
+               if not name.startswith('__')}
+        env['ite_scaffold'] = gen.test_ite_scaffold  # skip the drawing
+        env['write_tests'] = lambda: None            # ...and the file write
+        nb = json.load(open(os.path.join(DOC, 'scaffold.ipynb')))
+        for cell in nb['cells']:
+            if cell['cell_type'] != 'code': continue
+            code = ''.join(cell['source'])
+            if code.startswith('import'): continue
+            exec(code, env)
+        with open(os.path.join(SRC, 'test-swap-scaffold.rs'), newline='') as f:
+            expect = f.read()
+        assert gen.render_tests() == expect
+    finally:
+        sys.path.remove(DOC)
+
+
+if __name__ == '__main__':
+    test_generated_tests_match()
+    print('test_generated_tests_match ok')
@@ -229,6 +229,10 @@ impl NID {
   pub fn is_lit(&self)->bool { is_lit(*self) }
   pub fn is_inv(&self)->bool { is_inv(*self) }
   pub fn idx(&self)->usize { idx(*self) }
+  /// the raw bits, for callers (like FFI layers) that want to treat nids as plain ints.
+  pub fn to_raw(&self)->u64 { self.n }
+  /// reconstruct a nid from to_raw(). no validation is performed.
+  pub fn from_raw(n:u64)->Self { NID{ n }}
   pub const fn fun(arity:u8, tbl:u32)->Self { fun(arity,tbl) }
   pub fn is_fun(&self)->bool { is_fun(self) }
   pub fn tbl(&self)->Option<u32> { tbl(self) }
@@ -269,3 +273,9 @@ impl NID {
   assert!(!NID::var(1).is_fun(), "var(1) should not be fun.");
   assert!(!NID::vir(1).is_fun(), "vir(1) should not be fun.");
   assert!(!NID::from_vid_idx(vid::NOV, 0).is_fun(), "idx var should not be fun");}
+
+#[test] fn test_raw() {
+  for &n in &[O, I, NID::var(3), !NID::var(3), NID::vir(7), nvi(1,0)] {
+    assert_eq!(n, NID::from_raw(n.to_raw()), "from_raw(to_raw({:?}))", n); }
+  assert_eq!(NID::var(3).to_raw() | INV, (!NID::var(3)).to_raw(),
+             "to_raw should carry the INV bit");}
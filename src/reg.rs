@@ -34,6 +34,17 @@ impl Reg {
     res}
 
 
+  /// the bits packed into bytes, little-endian (bit i -> byte i/8, bit i%8).
+  /// mostly for handing whole registers across FFI boundaries at once.
+  pub fn as_bytes(&self)->Vec<u8> {
+    let nbytes = size_of::<usize>();
+    let mut res = vec![0u8; (self.nbits + 7) / 8];
+    for (j, &raw) in self.data.iter().enumerate() {
+      for b in 0..nbytes {
+        let ix = j * nbytes + b;
+        if ix < res.len() { res[ix] = (raw >> (8*b)) as u8 }}}
+    res}
+
   /// fetch value of a bit by index
   pub fn get(&self, ix: usize )->bool {
     0 < (self.data[ix/USIZE] & 1 << (ix%USIZE)) }
@@ -150,6 +161,17 @@ fn test_reg_mut() {
   assert_eq!(None, reg.increment(), "11 -> 00"); }
 
 
+#[test] fn test_as_bytes() {
+  let r = Reg::from_bits(12, &[0, 3, 9]);
+  assert_eq!(r.as_bytes(), vec![0b0000_1001, 0b0000_0010]);
+  let mut big = Reg::new(65);
+  big.put(8, true); big.put(64, true);
+  let bytes = big.as_bytes();
+  assert_eq!(bytes.len(), 9, "65 bits should pack into 9 bytes");
+  assert_eq!(bytes[0], 0);
+  assert_eq!(bytes[1], 1, "bit 8 is the low bit of byte 1");
+  assert_eq!(bytes[8], 1, "bit 64 is the low bit of byte 8"); }
+
 #[test] fn test_bits() {
   let ten = Reg::from_bits(4, &[3,1]);
   assert_eq!(ten.as_usize(), 0b1010, "reg with bits 3 and 1 set should equal 10");